@@ -0,0 +1,71 @@
+"""
+Command line tools for exports and backups.
+
+Usage:
+    python -m app.cli export books --format jsonl > books.jsonl
+    python -m app.cli backup backups/library.db
+    python -m app.cli prewarm-isbn isbn-dump.jsonl
+"""
+import argparse
+import logging
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+from app import database
+from app.services import backup, export, metadata
+
+def run_export(args):
+    """Writes a table export to stdout or --output."""
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for chunk in export.stream_export(args.table, args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+def run_backup(args):
+    """Takes an online backup to the given path, or a timestamped file in BACKUP_DIR."""
+    if args.dest:
+        path = backup.backup_database(args.dest)
+    else:
+        path = backup.create_scheduled_backup()
+    print(path)
+
+def run_prewarm(args):
+    """Loads an offline ISBN dump into the metadata cache."""
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        count = metadata.prewarm_cache(db, args.dump)
+    finally:
+        db.close()
+    print(count)
+
+def main(argv=None):
+    """Parses arguments and runs the selected command."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s", stream=sys.stderr)
+
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Treehouse Library tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a table as CSV or JSON Lines")
+    export_parser.add_argument("table", choices=sorted(export.EXPORT_MODELS))
+    export_parser.add_argument("--format", choices=sorted(export.EXPORT_FORMATS), default="csv")
+    export_parser.add_argument("--output", "-o", help="File to write to (default: stdout)")
+    export_parser.set_defaults(func=run_export)
+
+    backup_parser = subparsers.add_parser("backup", help="Take an online backup of the database")
+    backup_parser.add_argument("dest", nargs="?", help="Backup file path (default: timestamped file in BACKUP_DIR)")
+    backup_parser.set_defaults(func=run_backup)
+
+    prewarm_parser = subparsers.add_parser("prewarm-isbn", help="Load an ISBN dump (CSV or JSONL with isbn, title, author) into the metadata cache")
+    prewarm_parser.add_argument("dump", help="Path to the dump file")
+    prewarm_parser.set_defaults(func=run_prewarm)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
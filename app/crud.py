@@ -1,7 +1,12 @@
+from sqlalchemy import text
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from . import models
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+# Number of days a book can be out before it is considered overdue
+LOAN_PERIOD_DAYS = 21
 
 def get_book(db: Session, isbn: str) -> Optional[models.Book]:
     """Retrieves a book by its ISBN."""
@@ -28,18 +33,22 @@ def create_patron(db: Session, name: str, email: str) -> models.Patron:
     return db_patron
 
 def create_checkout(db: Session, book_isbn: str, patron_id: int) -> models.Checkout:
-    """Creates a new checkout record for a book."""
-    db_checkout = models.Checkout(book_isbn=book_isbn, patron_id=patron_id)
+    """Creates a new checkout record for a book and updates the circulation rollups."""
+    db_checkout = models.Checkout(book_isbn=book_isbn, patron_id=patron_id, checked_out_at=datetime.now())
     db.add(db_checkout)
+    _record_checkout_stats(db, db_checkout)
     db.commit()
     db.refresh(db_checkout)
     return db_checkout
 
 def return_checkout(db: Session, checkout_id: int) -> Optional[models.Checkout]:
-    """Marks a checkout as returned."""
+    """Marks a checkout as returned and updates the circulation rollups."""
     db_checkout = db.query(models.Checkout).filter(models.Checkout.id == checkout_id).first()
     if db_checkout:
+        already_returned = db_checkout.returned_at is not None
         db_checkout.returned_at = datetime.now()
+        if not already_returned:
+            _record_return_stats(db, db_checkout)
         db.commit()
         db.refresh(db_checkout)
     return db_checkout
@@ -68,7 +77,7 @@ def get_all_active_checkouts(db: Session) -> List[models.Checkout]:
     """Retrieves all currently active checkouts."""
     return db.query(models.Checkout).filter(models.Checkout.returned_at == None).all()
 
-def get_overdue_checkouts(db: Session, days: int = 21) -> List[models.Checkout]:
+def get_overdue_checkouts(db: Session, days: int = LOAN_PERIOD_DAYS) -> List[models.Checkout]:
     """Retrieves checkouts that are overdue (older than 'days' and not returned)."""
     cutoff = datetime.now() - timedelta(days=days)
     return db.query(models.Checkout).filter(
@@ -117,6 +126,8 @@ def delete_book(db: Session, isbn: str) -> bool:
     db_book = db.query(models.Book).filter(models.Book.isbn == isbn).first()
     if db_book:
         db.delete(db_book)
+        # Its checkouts lose their ISBN, so it no longer counts towards the most-borrowed ranking
+        db.query(models.BookCirculation).filter(models.BookCirculation.book_isbn == isbn).delete()
         db.commit()
         return True
     return False
@@ -124,3 +135,376 @@ def delete_book(db: Session, isbn: str) -> bool:
 def get_checkout_history(db: Session, limit: int = 100) -> List[models.Checkout]:
     """Retrieves the checkout history ordered by checkout date."""
     return db.query(models.Checkout).order_by(models.Checkout.checked_out_at.desc()).limit(limit).all()
+
+def _rollup_periods(when: datetime) -> List[Tuple[str, str]]:
+    """Returns the (period_type, period_key) pairs a timestamp contributes to."""
+    return [
+        ("day", when.strftime("%Y-%m-%d")),
+        ("month", when.strftime("%Y-%m")),
+        ("all", "all"),
+    ]
+
+def _bump_rollup(db: Session, period_type: str, period_key: str, **increments: int) -> None:
+    """Adds the given increments to a rollup row, creating it if needed (single upsert)."""
+    rollup = models.CirculationRollup
+    stmt = sqlite_insert(rollup).values(period_type=period_type, period_key=period_key, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.period_type, rollup.period_key],
+        set_={name: getattr(rollup, name) + value for name, value in increments.items()}
+    )
+    db.execute(stmt)
+
+def _record_checkout_stats(db: Session, checkout: models.Checkout) -> None:
+    """Updates the rollups for a new checkout."""
+    for period_type, period_key in _rollup_periods(checkout.checked_out_at):
+        _bump_rollup(db, period_type, period_key, checkouts=1)
+        if checkout.patron_id is not None:
+            result = db.execute(
+                sqlite_insert(models.RollupBorrower)
+                .values(period_type=period_type, period_key=period_key, patron_id=checkout.patron_id)
+                .on_conflict_do_nothing()
+            )
+            if result.rowcount:
+                _bump_rollup(db, period_type, period_key, active_borrowers=1)
+
+    book_stmt = sqlite_insert(models.BookCirculation).values(book_isbn=checkout.book_isbn, checkout_count=1)
+    book_stmt = book_stmt.on_conflict_do_update(
+        index_elements=[models.BookCirculation.book_isbn],
+        set_={"checkout_count": models.BookCirculation.checkout_count + 1}
+    )
+    db.execute(book_stmt)
+
+def _loan_stats(checked_out_at: Optional[datetime], returned_at: datetime) -> Tuple[int, int]:
+    """Returns (loan_seconds, late_returns) contributed by a single return."""
+    if checked_out_at is None:
+        return 0, 0
+    duration = returned_at - checked_out_at
+    is_late = duration > timedelta(days=LOAN_PERIOD_DAYS)
+    return max(round(duration.total_seconds()), 0), int(is_late)
+
+def _record_return_stats(db: Session, checkout: models.Checkout) -> None:
+    """Updates the rollups for a return. Returns are counted in the period they happen in."""
+    loan_seconds, late_returns = _loan_stats(checkout.checked_out_at, checkout.returned_at)
+    for period_type, period_key in _rollup_periods(checkout.returned_at):
+        _bump_rollup(db, period_type, period_key, returns=1, loan_seconds=loan_seconds, late_returns=late_returns)
+
+    if late_returns:
+        # The loan leaves the overdue snapshot if it was already overdue when the snapshot was taken
+        rollup = models.CirculationRollup
+        became_overdue_at = checkout.checked_out_at + timedelta(days=LOAN_PERIOD_DAYS)
+        db.query(rollup).filter(
+            rollup.period_type == "all",
+            rollup.period_key == "all",
+            rollup.overdue_checked_at > became_overdue_at,
+            rollup.overdue_loans > 0
+        ).update({rollup.overdue_loans: rollup.overdue_loans - 1}, synchronize_session=False)
+
+# Rollup aggregates are computed set-wise inside SQLite over checkouts up to a
+# high-water id. Each checkout contributes to its day, its month and "all".
+_ROLLUP_PERIODS_CTE = """
+periods(period_type, fmt) AS (VALUES ('day', '%Y-%m-%d'), ('month', '%Y-%m'), ('all', NULL))
+"""
+
+_TEMP_ROLLUPS_SQL = text(f"""
+CREATE TEMP TABLE temp_rollups AS
+WITH {_ROLLUP_PERIODS_CTE},
+checkout_counts AS (
+    SELECT p.period_type, COALESCE(strftime(p.fmt, c.checked_out_at), 'all') AS period_key,
+        COUNT(*) AS checkouts, COUNT(DISTINCT c.patron_id) AS active_borrowers
+    FROM checkouts c CROSS JOIN periods p
+    WHERE c.id <= :high_water AND c.checked_out_at IS NOT NULL
+    GROUP BY 1, 2
+),
+return_counts AS (
+    SELECT p.period_type, COALESCE(strftime(p.fmt, c.returned_at), 'all') AS period_key,
+        COUNT(*) AS returns,
+        SUM(CASE WHEN c.checked_out_at IS NULL THEN 0 ELSE
+            MAX(CAST(ROUND((julianday(c.returned_at) - julianday(c.checked_out_at)) * 86400) AS INTEGER), 0) END) AS loan_seconds,
+        SUM(CASE WHEN julianday(c.returned_at) - julianday(c.checked_out_at) > :loan_days THEN 1 ELSE 0 END) AS late_returns
+    FROM checkouts c CROSS JOIN periods p
+    WHERE c.id <= :high_water AND c.returned_at IS NOT NULL
+    GROUP BY 1, 2
+)
+SELECT period_type, period_key,
+    SUM(checkouts) AS checkouts, SUM(returns) AS returns, SUM(loan_seconds) AS loan_seconds,
+    SUM(late_returns) AS late_returns, SUM(active_borrowers) AS active_borrowers
+FROM (
+    SELECT period_type, period_key, checkouts, 0 AS returns, 0 AS loan_seconds, 0 AS late_returns, active_borrowers
+    FROM checkout_counts
+    UNION ALL
+    SELECT period_type, period_key, 0, returns, loan_seconds, late_returns, 0
+    FROM return_counts
+)
+GROUP BY period_type, period_key
+""")
+
+_TEMP_BORROWERS_SQL = text(f"""
+CREATE TEMP TABLE temp_rollup_borrowers AS
+WITH {_ROLLUP_PERIODS_CTE}
+SELECT DISTINCT p.period_type, COALESCE(strftime(p.fmt, c.checked_out_at), 'all') AS period_key, c.patron_id
+FROM checkouts c CROSS JOIN periods p
+WHERE c.id <= :high_water AND c.checked_out_at IS NOT NULL AND c.patron_id IS NOT NULL
+""")
+
+_TEMP_BOOK_COUNTS_SQL = text("""
+CREATE TEMP TABLE temp_book_circulation AS
+SELECT book_isbn, COUNT(*) AS checkout_count
+FROM checkouts
+WHERE id <= :high_water AND book_isbn IS NOT NULL
+GROUP BY book_isbn
+""")
+
+_ROLLUP_TEMP_TABLES = ("temp_rollups", "temp_rollup_borrowers", "temp_book_circulation", "temp_returned")
+
+def rebuild_circulation_rollups(db: Session) -> int:
+    """
+    Recomputes all circulation rollups from the checkouts table.
+    Used to backfill existing history; day-to-day updates happen in create_checkout/return_checkout.
+    The aggregates are built into temp tables from one read snapshot without taking the
+    write lock. The lock is then held only to swap them in and replay the checkouts and
+    returns that were committed while the build ran. Returns the number of checkouts included.
+    """
+    # Temp tables belong to a connection, so use one connection for the whole build
+    with db.get_bind().connect() as conn:
+        try:
+            for table in _ROLLUP_TEMP_TABLES:
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+            # Build phase: a single read transaction, so every statement sees the same snapshot
+            conn.execute(text("BEGIN"))
+            high_water = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM checkouts")).scalar()
+            params = {"high_water": high_water, "loan_days": LOAN_PERIOD_DAYS}
+            conn.execute(_TEMP_ROLLUPS_SQL, params)
+            conn.execute(_TEMP_BORROWERS_SQL, params)
+            conn.execute(_TEMP_BOOK_COUNTS_SQL, params)
+            conn.execute(text("CREATE TEMP TABLE temp_returned (id INTEGER PRIMARY KEY)"))
+            conn.execute(text("""
+                INSERT INTO temp_returned (id)
+                SELECT id FROM checkouts WHERE id <= :high_water AND returned_at IS NOT NULL
+            """), params)
+            conn.commit()
+
+            # Swap phase: short write transaction
+            conn.execute(text("BEGIN IMMEDIATE"))
+            swap_db = Session(bind=conn)
+            processed = _swap_circulation_rollups(swap_db, high_water)
+            swap_db.close()
+            conn.commit()
+        finally:
+            conn.rollback()
+            for table in _ROLLUP_TEMP_TABLES:
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            conn.commit()
+    return processed
+
+def _swap_circulation_rollups(db: Session, high_water: int) -> int:
+    """
+    Replaces the rollup tables with the freshly built temp tables, then replays the
+    checkouts and returns committed after the build snapshot. Runs inside the write lock.
+    """
+    existing = get_circulation_rollup(db, "all", "all")
+    overdue_loans = existing.overdue_loans if existing else 0
+    overdue_checked_at = existing.overdue_checked_at if existing else None
+
+    db.execute(text("DELETE FROM circulation_rollups"))
+    db.execute(text("DELETE FROM rollup_borrowers"))
+    db.execute(text("DELETE FROM book_circulation"))
+    db.execute(text("""
+        INSERT INTO circulation_rollups
+            (period_type, period_key, checkouts, returns, loan_seconds, late_returns, active_borrowers, overdue_loans)
+        SELECT period_type, period_key, checkouts, returns, loan_seconds, late_returns, active_borrowers, 0
+        FROM temp_rollups
+    """))
+    db.execute(text("""
+        INSERT INTO rollup_borrowers (period_type, period_key, patron_id)
+        SELECT period_type, period_key, patron_id FROM temp_rollup_borrowers
+    """))
+    db.execute(text("""
+        INSERT INTO book_circulation (book_isbn, checkout_count)
+        SELECT book_isbn, checkout_count FROM temp_book_circulation
+        WHERE book_isbn IN (SELECT isbn FROM books)
+    """))
+    processed = db.execute(text("SELECT COUNT(*) FROM checkouts WHERE id <= :high_water"), {"high_water": high_water}).scalar()
+
+    # Replay what was committed during the build: new checkouts, and returns of older ones
+    for checkout in db.query(models.Checkout).filter(models.Checkout.id > high_water).order_by(models.Checkout.id):
+        _record_checkout_stats(db, checkout)
+        if checkout.returned_at is not None:
+            _record_return_stats(db, checkout)
+        processed += 1
+    returned_ids = db.execute(text("""
+        SELECT id FROM checkouts
+        WHERE id <= :high_water AND returned_at IS NOT NULL AND id NOT IN (SELECT id FROM temp_returned)
+    """), {"high_water": high_water}).scalars().all()
+    for checkout in db.query(models.Checkout).filter(models.Checkout.id.in_(returned_ids)):
+        _record_return_stats(db, checkout)
+
+    # Keep the overdue snapshot taken by the daily overdue check; the replayed returns
+    # have already been taken out of it by the incremental path
+    rollup = models.CirculationRollup
+    stmt = sqlite_insert(rollup).values(
+        period_type="all", period_key="all", overdue_loans=overdue_loans, overdue_checked_at=overdue_checked_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.period_type, rollup.period_key],
+        set_={"overdue_loans": overdue_loans, "overdue_checked_at": overdue_checked_at}
+    )
+    db.execute(stmt)
+    db.add(models.RollupBuild(high_water_checkout_id=high_water))
+    db.flush()
+    return processed
+
+def get_last_rollup_build(db: Session) -> Optional[models.RollupBuild]:
+    """Retrieves the most recent completed rollup rebuild, if any."""
+    return db.query(models.RollupBuild).order_by(models.RollupBuild.id.desc()).first()
+
+def set_overdue_loans(db: Session, count: int, checked_at: datetime) -> None:
+    """Records how many active loans were overdue at checked_at on the all-time rollup."""
+    rollup = models.CirculationRollup
+    stmt = sqlite_insert(rollup).values(period_type="all", period_key="all", overdue_loans=count, overdue_checked_at=checked_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.period_type, rollup.period_key],
+        set_={"overdue_loans": count, "overdue_checked_at": checked_at}
+    )
+    db.execute(stmt)
+    db.commit()
+
+def get_circulation_rollup(db: Session, period_type: str, period_key: str) -> Optional[models.CirculationRollup]:
+    """Retrieves a single circulation rollup row."""
+    return db.query(models.CirculationRollup).filter(
+        models.CirculationRollup.period_type == period_type,
+        models.CirculationRollup.period_key == period_key
+    ).first()
+
+def get_recent_circulation_rollups(db: Session, period_type: str, limit: int = 12) -> List[models.CirculationRollup]:
+    """Retrieves the most recent rollups of a given period type ("day" or "month")."""
+    return db.query(models.CirculationRollup).filter(
+        models.CirculationRollup.period_type == period_type
+    ).order_by(models.CirculationRollup.period_key.desc()).limit(limit).all()
+
+def get_most_borrowed_books(db: Session, limit: int = 10) -> List[Tuple[models.BookCirculation, models.Book]]:
+    """Retrieves the most borrowed books along with their catalog entry."""
+    return db.query(models.BookCirculation, models.Book).join(
+        models.Book, models.Book.isbn == models.BookCirculation.book_isbn
+    ).order_by(models.BookCirculation.checkout_count.desc()).limit(limit).all()
+
+# Co-occurrence counts are computed set-wise inside SQLite: one self-join per
+# interaction type over distinct (patron, book) pairs, then ROW_NUMBER() keeps
+# the top K neighbors per book. Each patron contributes at most max_books books,
+# which bounds the self-join at max_books^2 pairs per patron.
+_TEMP_BORROWED_SQL = text("""
+CREATE TEMP TABLE temp_borrowed AS
+SELECT patron_id, book_isbn FROM (
+    SELECT patron_id, book_isbn,
+        ROW_NUMBER() OVER (PARTITION BY patron_id ORDER BY MAX(checked_out_at) DESC) AS recency
+    FROM checkouts
+    WHERE patron_id IS NOT NULL AND book_isbn IN (SELECT isbn FROM books)
+    GROUP BY patron_id, book_isbn
+)
+WHERE recency <= :max_books
+""")
+
+_TEMP_LIKED_SQL = text("""
+CREATE TEMP TABLE temp_liked AS
+SELECT patron_id, book_isbn FROM (
+    SELECT patron_id, book_isbn,
+        ROW_NUMBER() OVER (PARTITION BY patron_id ORDER BY MAX(created_at) DESC) AS recency
+    FROM ratings
+    WHERE patron_id IS NOT NULL AND star_rating >= :min_stars AND book_isbn IN (SELECT isbn FROM books)
+    GROUP BY patron_id, book_isbn
+)
+WHERE recency <= :max_books
+""")
+
+_TEMP_NEIGHBORS_SQL = text("""
+CREATE TEMP TABLE temp_neighbors AS
+WITH pairs AS (
+    SELECT a.book_isbn AS book_isbn, b.book_isbn AS neighbor_isbn, COUNT(*) AS co_borrowers, 0 AS co_raters
+    FROM temp_borrowed a JOIN temp_borrowed b ON a.patron_id = b.patron_id AND a.book_isbn != b.book_isbn
+    GROUP BY a.book_isbn, b.book_isbn
+    UNION ALL
+    SELECT a.book_isbn, b.book_isbn, 0, COUNT(*)
+    FROM temp_liked a JOIN temp_liked b ON a.patron_id = b.patron_id AND a.book_isbn != b.book_isbn
+    GROUP BY a.book_isbn, b.book_isbn
+),
+totals AS (
+    SELECT book_isbn, neighbor_isbn, SUM(co_borrowers) AS co_borrowers, SUM(co_raters) AS co_raters
+    FROM pairs
+    GROUP BY book_isbn, neighbor_isbn
+),
+ranked AS (
+    SELECT book_isbn, neighbor_isbn, co_borrowers, co_raters, co_borrowers + co_raters AS score,
+        ROW_NUMBER() OVER (
+            PARTITION BY book_isbn
+            ORDER BY co_borrowers + co_raters DESC, co_borrowers DESC, neighbor_isbn
+        ) AS position
+    FROM totals
+)
+SELECT book_isbn, position, neighbor_isbn, score, co_borrowers, co_raters
+FROM ranked
+WHERE position <= :top_k
+""")
+
+_TEMP_TABLES = ("temp_borrowed", "temp_liked", "temp_neighbors")
+
+def rebuild_book_neighbors(db: Session, top_k: int = 10, min_stars: int = 4, max_books: int = 50) -> int:
+    """
+    Rebuilds the "readers also borrowed" table from checkouts and ratings.
+    Two books are neighbors when the same patron borrowed both, or rated both
+    at least min_stars; only each patron's max_books most recent books count.
+    The heavy work goes into temp tables without taking the write lock, which is
+    then held only for a short swap. Returns the number of neighbor rows written.
+    """
+    # Temp tables belong to a connection, so use one connection for the whole build
+    with db.get_bind().connect() as conn:
+        try:
+            for table in _TEMP_TABLES:
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            conn.execute(_TEMP_BORROWED_SQL, {"max_books": max_books})
+            conn.execute(_TEMP_LIKED_SQL, {"min_stars": min_stars, "max_books": max_books})
+            conn.execute(text("CREATE INDEX temp_borrowed_patron ON temp_borrowed (patron_id, book_isbn)"))
+            conn.execute(text("CREATE INDEX temp_liked_patron ON temp_liked (patron_id, book_isbn)"))
+            conn.execute(_TEMP_NEIGHBORS_SQL, {"top_k": top_k})
+            conn.commit()
+
+            conn.execute(text("DELETE FROM book_neighbors"))
+            written = conn.execute(text("""
+                INSERT INTO book_neighbors (book_isbn, position, neighbor_isbn, score, co_borrowers, co_raters)
+                SELECT book_isbn, position, neighbor_isbn, score, co_borrowers, co_raters FROM temp_neighbors
+            """)).rowcount
+            conn.commit()
+        finally:
+            conn.rollback()
+            for table in _TEMP_TABLES:
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            conn.commit()
+    return written
+
+def get_book_neighbors(db: Session, isbn: str, limit: int = 5) -> List[models.Book]:
+    """Retrieves the precomputed "readers also borrowed" books for a book."""
+    return db.query(models.Book).join(
+        models.BookNeighbor, models.BookNeighbor.neighbor_isbn == models.Book.isbn
+    ).filter(
+        models.BookNeighbor.book_isbn == isbn,
+        models.BookNeighbor.position <= limit
+    ).order_by(models.BookNeighbor.position).all()
+
+def get_isbn_metadata(db: Session, isbn: str) -> Optional[models.IsbnMetadata]:
+    """Retrieves a cached ISBN metadata entry, refreshed from the database."""
+    return db.query(models.IsbnMetadata).filter(models.IsbnMetadata.isbn == isbn).populate_existing().first()
+
+def upsert_isbn_metadata(db: Session, entries: List[dict]) -> int:
+    """
+    Inserts or refreshes cached ISBN metadata entries in one statement.
+    Each entry has isbn, title, author, source and fetched_at keys.
+    """
+    if not entries:
+        return 0
+    stmt = sqlite_insert(models.IsbnMetadata).values(entries)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.IsbnMetadata.isbn],
+        set_={name: stmt.excluded[name] for name in ("title", "author", "source", "fetched_at")}
+    )
+    db.execute(stmt)
+    db.commit()
+    return len(entries)
@@ -93,3 +93,78 @@ class ReminderLog(Base):
 
 # Update Checkout to include back_populates
 Checkout.reminders = relationship("ReminderLog", back_populates="checkout")
+
+class CirculationRollup(Base):
+    """
+    Pre-aggregated circulation counters for a single period.
+    period_type is "day", "month" or "all"; period_key is "YYYY-MM-DD", "YYYY-MM" or "all".
+    Updated incrementally as books are checked out and returned.
+    """
+    __tablename__ = "circulation_rollups"
+
+    period_type = Column(String, primary_key=True)
+    period_key = Column(String, primary_key=True)
+    checkouts = Column(Integer, default=0, nullable=False)
+    returns = Column(Integer, default=0, nullable=False)
+    loan_seconds = Column(Integer, default=0, nullable=False) # Sum of loan durations for returns in this period
+    late_returns = Column(Integer, default=0, nullable=False) # Returns after the loan period
+    active_borrowers = Column(Integer, default=0, nullable=False) # Distinct patrons who checked out in this period
+    overdue_loans = Column(Integer, default=0, nullable=False) # "all" row only: active loans past the loan period at the last overdue check
+    overdue_checked_at = Column(DateTime, nullable=True) # "all" row only: when overdue_loans was counted
+
+class RollupBuild(Base):
+    """
+    Records each completed rebuild of the circulation rollups.
+    high_water_checkout_id is the newest checkout included in the rebuilt history.
+    """
+    __tablename__ = "rollup_builds"
+
+    id = Column(Integer, primary_key=True, index=True)
+    built_at = Column(DateTime, default=datetime.now)
+    high_water_checkout_id = Column(Integer, nullable=False)
+
+class RollupBorrower(Base):
+    """
+    Tracks which patrons have already been counted as active borrowers for a rollup period.
+    """
+    __tablename__ = "rollup_borrowers"
+
+    period_type = Column(String, primary_key=True)
+    period_key = Column(String, primary_key=True)
+    patron_id = Column(Integer, primary_key=True)
+
+class BookCirculation(Base):
+    """
+    Running checkout count per book, used for the most-borrowed ranking.
+    """
+    __tablename__ = "book_circulation"
+
+    book_isbn = Column(String, primary_key=True)
+    checkout_count = Column(Integer, default=0, nullable=False, index=True)
+
+class BookNeighbor(Base):
+    """
+    Precomputed "readers also borrowed" recommendation for a book.
+    Rebuilt nightly; each book keeps its top neighbors ordered by position.
+    """
+    __tablename__ = "book_neighbors"
+
+    book_isbn = Column(String, primary_key=True)
+    position = Column(Integer, primary_key=True) # 1 = strongest neighbor
+    neighbor_isbn = Column(String, nullable=False)
+    score = Column(Integer, nullable=False)
+    co_borrowers = Column(Integer, nullable=False) # Patrons who borrowed both books
+    co_raters = Column(Integer, nullable=False) # Patrons who rated both books highly
+
+class IsbnMetadata(Base):
+    """
+    Cached ISBN -> title/author lookups used to prefill the add book form.
+    A row with no title records that the provider had no match (negative cache).
+    """
+    __tablename__ = "isbn_metadata"
+
+    isbn = Column(String, primary_key=True)
+    title = Column(String, nullable=True)
+    author = Column(String, nullable=True)
+    source = Column(String) # Provider name, or "dump" for pre-warmed rows
+    fetched_at = Column(DateTime, default=datetime.now)
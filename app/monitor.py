@@ -2,7 +2,7 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app import crud, database, models
-from app.services import email
+from app.services import email, backup
 import time
 import logging
 
@@ -17,7 +17,9 @@ def check_overdue_books():
     logger.info("Running overdue book check...")
     db = database.SessionLocal()
     try:
+        checked_at = datetime.now()
         overdue = crud.get_overdue_checkouts(db)
+        crud.set_overdue_loans(db, len(overdue), checked_at)
         count = 0
         for checkout in overdue:
             # Simple check: if we haven't sent a reminder today?
@@ -100,6 +102,57 @@ def send_monthly_newsletter():
     finally:
         db.close()
 
+def rebuild_circulation_stats(only_if_missing: bool = False):
+    """
+    Job to rebuild the circulation rollup tables from the full checkout history.
+    Rollups are kept up to date incrementally on checkout/return, so this is only
+    needed to backfill existing data. Runs once at startup until a rebuild has completed.
+    """
+    logger.info("Running circulation stats rebuild...")
+    db = database.SessionLocal()
+    try:
+        if only_if_missing and crud.get_last_rollup_build(db):
+            logger.info("Circulation stats already built. Skipping rebuild.")
+            return
+
+        processed = crud.rebuild_circulation_rollups(db)
+        logger.info(f"Rebuilt circulation stats from {processed} checkouts.")
+
+    except Exception as e:
+        logger.error(f"Error in circulation stats job: {e}")
+    finally:
+        db.close()
+
+def build_book_recommendations():
+    """
+    Scheduled job to rebuild the "readers also borrowed" neighbors table.
+    Runs daily at 2:00 AM.
+    """
+    logger.info("Running book recommendations build...")
+    db = database.SessionLocal()
+    try:
+        started = time.monotonic()
+        written = crud.rebuild_book_neighbors(db)
+        logger.info(f"Built {written} book recommendations in {time.monotonic() - started:.1f}s.")
+
+    except Exception as e:
+        logger.error(f"Error in book recommendations job: {e}")
+    finally:
+        db.close()
+
+def backup_database():
+    """
+    Scheduled job to take an online backup of the database.
+    Runs daily at 3:00 AM.
+    """
+    logger.info("Running database backup...")
+    try:
+        path = backup.create_scheduled_backup()
+        logger.info(f"Backup written to {path}.")
+
+    except Exception as e:
+        logger.error(f"Error in backup job: {e}")
+
 def start_scheduler():
     """
     Initializes and starts the background scheduler for periodic tasks.
@@ -111,8 +164,20 @@ def start_scheduler():
     
     # New job: Newsletter on the 1st of every month at 11 AM
     scheduler.add_job(send_monthly_newsletter, 'cron', day=1, hour=11, minute=0)
+
+    # Nightly job: Rebuild "readers also borrowed" recommendations at 2 AM
+    scheduler.add_job(build_book_recommendations, 'cron', hour=2, minute=0)
+
+    # Nightly job: Online database backup at 3 AM
+    scheduler.add_job(backup_database, 'cron', hour=3, minute=0)
+
+    # One-off job: Backfill circulation stats if they have never been built
+    scheduler.add_job(rebuild_circulation_stats, kwargs={"only_if_missing": True})
     
     scheduler.start()
     logger.info("Scheduler started.")
     logger.info("- 'check_overdue_books' scheduled for 10:00 AM daily.")
     logger.info("- 'send_monthly_newsletter' scheduled for 1st of month at 11:00 AM.")
+    logger.info("- 'build_book_recommendations' scheduled for 2:00 AM daily.")
+    logger.info("- 'backup_database' scheduled for 3:00 AM daily.")
+    logger.info("- 'rebuild_circulation_stats' scheduled to run once at startup if needed.")
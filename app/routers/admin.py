@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Request, Depends, status, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Depends, status, Form, Query, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app import crud, database, models
 from app import monitor
+from app.services import export
 import time
 
 router = APIRouter(prefix="/admin")
@@ -26,6 +27,7 @@ def admin_dashboard(request: Request, db: Session = Depends(database.get_db)):
         "logs": logs,
         "books": books,
         "history": history,
+        "export_tables": list(export.EXPORT_MODELS),
         "now": datetime.now()
     })
 
@@ -110,3 +112,112 @@ def admin_trigger_newsletter(db: Session = Depends(database.get_db)):
     monitor.send_monthly_newsletter()
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
 
+@router.post("/trigger-stats-rebuild")
+def admin_trigger_stats_rebuild(db: Session = Depends(database.get_db)):
+    """
+    Manually rebuilds the circulation stats from the full checkout history.
+    """
+    monitor.rebuild_circulation_stats()
+    return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.post("/trigger-recommendations")
+def admin_trigger_recommendations(db: Session = Depends(database.get_db)):
+    """
+    Manually rebuilds the "readers also borrowed" recommendations.
+    """
+    monitor.build_book_recommendations()
+    return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.post("/trigger-backup")
+def admin_trigger_backup():
+    """
+    Manually takes an online backup of the database.
+    """
+    monitor.backup_database()
+    return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.get("/export/{table}")
+def admin_export(table: str, fmt: str = Query("csv", alias="format", pattern=f"^({'|'.join(export.EXPORT_FORMATS)})$")):
+    """
+    Streams a full export of a table as CSV or JSON Lines.
+    Rows are read in batches, so memory use stays flat regardless of table size.
+    """
+    if table not in export.EXPORT_MODELS:
+        raise HTTPException(status_code=404, detail=f"Unknown table '{table}'")
+
+    filename = f"{table}-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return StreamingResponse(
+        export.stream_export(table, fmt),
+        media_type=export.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _serialize_rollup(period: str, rollup: models.CirculationRollup = None) -> dict:
+    """
+    Converts a rollup row into the JSON shape used by the stats API.
+    Late-return rate is the share of returns that came back after the loan period;
+    it does not include loans that are still out.
+    """
+    checkouts = rollup.checkouts if rollup else 0
+    returns = rollup.returns if rollup else 0
+    loan_seconds = rollup.loan_seconds if rollup else 0
+    late_returns = rollup.late_returns if rollup else 0
+    return {
+        "period": period,
+        "checkouts": checkouts,
+        "returns": returns,
+        "active_borrowers": rollup.active_borrowers if rollup else 0,
+        "average_loan_days": round(loan_seconds / returns / 86400, 2) if returns else None,
+        "late_return_rate": round(late_returns / returns, 4) if returns else None,
+    }
+
+@router.get("/api/stats")
+def admin_stats_summary(db: Session = Depends(database.get_db)):
+    """
+    API endpoint for all-time circulation stats.
+    Reads a single precomputed rollup row.
+    Overdue rate counts both late returns and loans that are overdue right now
+    (as of the last daily overdue check, less those returned since), out of all
+    returned or overdue loans.
+    """
+    rollup = crud.get_circulation_rollup(db, "all", "all")
+    stats = _serialize_rollup("all", rollup)
+    overdue_loans = rollup.overdue_loans if rollup else 0
+    late = (rollup.late_returns if rollup else 0) + overdue_loans
+    settled = stats["returns"] + overdue_loans
+    stats["overdue_loans"] = overdue_loans
+    stats["overdue_rate"] = round(late / settled, 4) if settled else None
+    return stats
+
+@router.get("/api/stats/monthly")
+def admin_stats_monthly(months: int = Query(12, ge=1, le=120), db: Session = Depends(database.get_db)):
+    """
+    API endpoint for per-month circulation stats, most recent first.
+    """
+    rollups = crud.get_recent_circulation_rollups(db, "month", limit=months)
+    return [_serialize_rollup(r.period_key, r) for r in rollups]
+
+@router.get("/api/stats/daily")
+def admin_stats_daily(days: int = Query(30, ge=1, le=366), db: Session = Depends(database.get_db)):
+    """
+    API endpoint for per-day circulation stats, most recent first.
+    Days without any activity are omitted.
+    """
+    rollups = crud.get_recent_circulation_rollups(db, "day", limit=days)
+    return [_serialize_rollup(r.period_key, r) for r in rollups]
+
+@router.get("/api/stats/top-books")
+def admin_stats_top_books(limit: int = Query(10, ge=1, le=100), db: Session = Depends(database.get_db)):
+    """
+    API endpoint for the most borrowed books of all time.
+    """
+    results = crud.get_most_borrowed_books(db, limit=limit)
+    return [
+        {
+            "isbn": circulation.book_isbn,
+            "title": book.title,
+            "author": book.author,
+            "checkouts": circulation.checkout_count,
+        }
+        for circulation, book in results
+    ]
@@ -3,6 +3,11 @@ from fastapi.responses import RedirectResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from app import crud, models, database
+from app.services import metadata
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -39,11 +44,19 @@ def scan_isbn(request: Request, isbn: str = Form(...), db: Session = Depends(dat
     return RedirectResponse(url=f"/book/{isbn}/checkout", status_code=status.HTTP_303_SEE_OTHER)
 
 @router.get("/book/{isbn}/add", response_class=HTMLResponse)
-def add_book_form(request: Request, isbn: str):
+def add_book_form(
+    request: Request,
+    isbn: str,
+    db: Session = Depends(database.get_db),
+    lookup: metadata.MetadataLookup = Depends(metadata.get_lookup)
+):
     """
     Renders the form to add a new book.
+    Prefills title and author from the metadata cache; on a cache miss the page
+    fetches them from /api/isbn/{isbn} instead.
     """
-    return templates.TemplateResponse("book_add.html", {"request": request, "isbn": isbn})
+    cached = lookup.get_cached(db, isbn)
+    return templates.TemplateResponse("book_add.html", {"request": request, "isbn": isbn, "cached": cached})
 
 @router.post("/book/{isbn}/add")
 def add_book(
@@ -70,8 +83,10 @@ def checkout_book_form(request: Request, isbn: str, db: Session = Depends(databa
     book = crud.get_book(db, isbn)
     if not book:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-        
-    return templates.TemplateResponse("book_details.html", {"request": request, "book": book})
+
+    # Recommendations are precomputed nightly by monitor.build_book_recommendations
+    also_borrowed = crud.get_book_neighbors(db, isbn)
+    return templates.TemplateResponse("book_details.html", {"request": request, "book": book, "also_borrowed": also_borrowed})
 
 @router.post("/book/{isbn}/checkout")
 def checkout_book(
@@ -158,3 +173,18 @@ def search_patrons(q: str = "", db: Session = Depends(database.get_db)):
         return []
     patrons = db.query(models.Patron).filter(models.Patron.name.ilike(f"%{q}%")).limit(10).all()
     return [{"name": p.name, "email": p.email} for p in patrons]
+
+@router.get("/api/isbn/{isbn}")
+def lookup_isbn(isbn: str, db: Session = Depends(database.get_db), lookup: metadata.MetadataLookup = Depends(metadata.get_lookup)):
+    """
+    API endpoint for looking up a book's title and author by ISBN.
+    Used to prefill the add book form when the metadata cache has no entry.
+    """
+    try:
+        result = lookup.lookup(db, isbn)
+    except Exception as e:
+        logger.error(f"ISBN lookup failed for {isbn}: {e}")
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Lookup failed")
+    if not result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    return {"isbn": result.isbn, "title": result.title, "author": result.author}
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Optional
+from app import database
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def backup_database(dest_path: str, pages: int = 256, sleep: float = 0.05) -> str:
+    """
+    Copies the live database to dest_path using the SQLite online backup API,
+    `pages` pages per step; `sleep` is only used to back off when a step finds the
+    database busy or locked. Writes to a temporary file first so dest_path is
+    never a partial copy; the temporary file is removed if the backup fails.
+    """
+    source_path = database.engine.url.database
+    tmp_path = f"{dest_path}.partial"
+
+    source = sqlite3.connect(source_path)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        source.backup(dest, pages=pages, sleep=sleep)
+    except Exception:
+        dest.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        dest.close()
+        source.close()
+
+    os.replace(tmp_path, dest_path)
+    logger.info(f"Database backed up to {dest_path}")
+    return dest_path
+
+def prune_backups(backup_dir: str, keep: int) -> int:
+    """
+    Deletes all but the newest `keep` backups in backup_dir.
+    Always keeps at least one, so the backup just taken is never removed.
+    Returns the number of files removed.
+    """
+    keep = max(keep, 1)
+    backups = sorted(
+        name for name in os.listdir(backup_dir)
+        if name.startswith("library-") and name.endswith(".db")
+    )
+    stale = backups[:-keep]
+    for name in stale:
+        os.remove(os.path.join(backup_dir, name))
+    return len(stale)
+
+def create_scheduled_backup(backup_dir: Optional[str] = None, keep: Optional[int] = None) -> str:
+    """
+    Writes a timestamped backup into backup_dir and prunes old ones.
+    Defaults come from the BACKUP_DIR and BACKUP_KEEP environment variables.
+    """
+    backup_dir = backup_dir or os.environ.get("BACKUP_DIR", "backups")
+    keep = keep if keep is not None else int(os.environ.get("BACKUP_KEEP", "7"))
+
+    os.makedirs(backup_dir, exist_ok=True)
+    filename = f"library-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    path = backup_database(os.path.join(backup_dir, filename))
+
+    removed = prune_backups(backup_dir, keep)
+    if removed:
+        logger.info(f"Removed {removed} old backups from {backup_dir}")
+    return path
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterator, List
+from app import database, models
+
+# Tables that can be exported, keyed by the name used in URLs and the CLI
+EXPORT_MODELS = {
+    "books": models.Book,
+    "patrons": models.Patron,
+    "checkouts": models.Checkout,
+    "ratings": models.Rating,
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+def _json_default(value):
+    """Serializes dates for JSON Lines output."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def export_columns(table: str) -> List[str]:
+    """Returns the column names exported for a table."""
+    return [column.name for column in EXPORT_MODELS[table].__table__.columns]
+
+def stream_export(table: str, fmt: str, batch_size: int = 1000, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    Yields a table export as CSV or JSON Lines text chunks of roughly chunk_size characters.
+    Rows are fetched batch_size at a time, so memory use does not grow with the table.
+    Opens its own session so it can outlive the request that started it.
+    """
+    model = EXPORT_MODELS[table]
+    columns = export_columns(table)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+
+    if writer:
+        writer.writerow(columns)
+
+    db = database.SessionLocal()
+    try:
+        table_columns = model.__table__.columns
+        primary_key = model.__table__.primary_key.columns
+        rows = db.query(*table_columns).order_by(*primary_key).yield_per(batch_size)
+
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=_json_default))
+                buffer.write("\n")
+
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    finally:
+        db.close()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,211 @@
+import csv
+import json
+import os
+import threading
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+import httpx
+from sqlalchemy.orm import Session
+from app import crud, models
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache source for entries loaded by prewarm_cache
+DUMP_SOURCE = "dump"
+
+@dataclass
+class BookMetadata:
+    """
+    Title and author for an ISBN, as returned by a metadata provider.
+    """
+    isbn: str
+    title: Optional[str]
+    author: Optional[str]
+
+def normalize_isbn(isbn: str) -> str:
+    """Removes dashes and whitespace from a scanned ISBN."""
+    return "".join(ch for ch in isbn if ch not in "- \t\r\n")
+
+class MetadataProvider(ABC):
+    """
+    Looks up book metadata by ISBN.
+    Subclasses implement lookup(), returning None when the ISBN is unknown
+    and raising when the provider itself fails.
+    """
+    name = "base"
+
+    @abstractmethod
+    def lookup(self, isbn: str) -> Optional[BookMetadata]:
+        """Returns metadata for a normalized ISBN, or None if it is unknown."""
+
+class OpenLibraryProvider(MetadataProvider):
+    """
+    Looks up ISBNs with the Open Library search API.
+    """
+    name = "openlibrary"
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+
+    def lookup(self, isbn: str) -> Optional[BookMetadata]:
+        res = httpx.get(
+            "https://openlibrary.org/search.json",
+            params={"isbn": isbn, "limit": 1},
+            timeout=self.timeout
+        )
+        res.raise_for_status()
+        docs = res.json().get("docs") or []
+        if not docs:
+            return None
+        doc = docs[0]
+        authors = doc.get("author_name") or []
+        return BookMetadata(isbn=isbn, title=doc.get("title"), author=", ".join(authors) or None)
+
+class LocalProvider(MetadataProvider):
+    """
+    Serves lookups from an in-memory mapping.
+    Useful as a stand-in for tests and offline setups.
+    """
+    name = "local"
+
+    def __init__(self, records: Optional[Dict[str, BookMetadata]] = None):
+        self.records = records or {}
+
+    def lookup(self, isbn: str) -> Optional[BookMetadata]:
+        return self.records.get(isbn)
+
+class MetadataLookup:
+    """
+    Cached, coalescing ISBN lookups on top of a provider.
+    Results (including misses) are stored in the isbn_metadata table; concurrent
+    lookups for the same uncached ISBN share a single provider call.
+    Entries loaded from an offline dump never expire.
+    """
+
+    def __init__(self, provider: MetadataProvider, ttl: timedelta = timedelta(days=30), miss_ttl: timedelta = timedelta(days=1)):
+        self.provider = provider
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    @staticmethod
+    def _to_metadata(entry: models.IsbnMetadata) -> Optional[BookMetadata]:
+        """Converts a cache entry to metadata; cached misses have no title."""
+        return BookMetadata(isbn=entry.isbn, title=entry.title, author=entry.author) if entry.title else None
+
+    def get_cached(self, db: Session, isbn: str) -> Optional[models.IsbnMetadata]:
+        """Returns the cache entry for an ISBN if it has not expired."""
+        entry = crud.get_isbn_metadata(db, normalize_isbn(isbn))
+        if not entry or not entry.fetched_at:
+            return None
+        if entry.source == DUMP_SOURCE:
+            return entry
+        ttl = self.ttl if entry.title else self.miss_ttl
+        if datetime.now() - entry.fetched_at > ttl:
+            return None
+        return entry
+
+    def lookup(self, db: Session, isbn: str) -> Optional[BookMetadata]:
+        """
+        Returns metadata for an ISBN from the cache, falling back to the provider.
+        Returns None if the ISBN is unknown. Provider errors are raised and not cached.
+        """
+        isbn = normalize_isbn(isbn)
+        entry = self.get_cached(db, isbn)
+        if entry:
+            return self._to_metadata(entry)
+
+        with self._inflight_lock:
+            future = self._inflight.get(isbn)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[isbn] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            # Another leader may have filled the cache between our miss and taking the lead
+            entry = self.get_cached(db, isbn)
+            if entry:
+                result = self._to_metadata(entry)
+                future.set_result(result)
+                return result
+
+            result = self.provider.lookup(isbn)
+            crud.upsert_isbn_metadata(db, [{
+                "isbn": isbn,
+                "title": result.title if result else None,
+                "author": result.author if result else None,
+                "source": self.provider.name,
+                "fetched_at": datetime.now(),
+            }])
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(isbn, None)
+
+def _read_dump(path: str) -> Iterator[dict]:
+    """Yields isbn/title/author records from a CSV or JSON Lines dump file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def prewarm_cache(db: Session, path: str, batch_size: int = 1000) -> int:
+    """
+    Loads an offline dump into the metadata cache.
+    The dump is a CSV (with isbn, title, author columns) or JSON Lines file with
+    the same keys. Returns the number of entries written.
+    """
+    count = 0
+    batch: List[dict] = []
+    fetched_at = datetime.now()
+    for record in _read_dump(path):
+        isbn = normalize_isbn(str(record.get("isbn") or ""))
+        if not isbn or not record.get("title"):
+            continue
+        batch.append({
+            "isbn": isbn,
+            "title": record["title"],
+            "author": record.get("author") or None,
+            "source": DUMP_SOURCE,
+            "fetched_at": fetched_at,
+        })
+        if len(batch) >= batch_size:
+            count += crud.upsert_isbn_metadata(db, batch)
+            batch = []
+    count += crud.upsert_isbn_metadata(db, batch)
+    logger.info(f"Pre-warmed {count} ISBN metadata entries from {path}")
+    return count
+
+_lookup: Optional[MetadataLookup] = None
+_lookup_lock = threading.Lock()
+
+def get_lookup() -> MetadataLookup:
+    """
+    Returns the shared MetadataLookup, configured by ISBN_METADATA_PROVIDER
+    ("openlibrary" by default, or "none" to rely on the cache alone).
+    Routes depend on this, so tests can override it with a LocalProvider.
+    """
+    global _lookup
+    with _lookup_lock:
+        if _lookup is None:
+            provider_name = os.environ.get("ISBN_METADATA_PROVIDER", "openlibrary")
+            provider = LocalProvider() if provider_name == "none" else OpenLibraryProvider()
+            _lookup = MetadataLookup(provider)
+    return _lookup
@@ -0,0 +1,46 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app import database
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """
+    Points the app at a fresh SQLite file for each test.
+    Code that opens its own sessions (monitor jobs, exports, backups) picks it up too.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'library.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", database._enable_wal)
+    database.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def make_client(engine):
+    """Builds a TestClient for the given routers, backed by the test database."""
+    def _make_client(*routers, overrides=None):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+
+        def get_test_db():
+            session = database.SessionLocal()
+            try:
+                yield session
+            finally:
+                session.close()
+
+        app.dependency_overrides[database.get_db] = get_test_db
+        app.dependency_overrides.update(overrides or {})
+        return TestClient(app)
+    return _make_client
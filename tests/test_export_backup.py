@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import pytest
+from app import crud
+from app.routers import admin
+from app.services import backup, export
+
+@pytest.fixture
+def books(db):
+    for i in range(25):
+        crud.create_book(db, isbn=f"isbn-{i:02d}", title=f"Title, {i}", author="Author")
+
+def test_csv_export_streams_in_chunks(books):
+    chunks = list(export.stream_export("books", "csv", batch_size=10, chunk_size=200))
+
+    assert len(chunks) > 1
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == export.export_columns("books")
+    assert len(rows) == 26
+    assert rows[1][:3] == ["isbn-00", "Title, 0", "Author"]
+
+def test_jsonl_export(books):
+    lines = "".join(export.stream_export("books", "jsonl")).splitlines()
+
+    assert len(lines) == 25
+    first = json.loads(lines[0])
+    assert first["isbn"] == "isbn-00"
+    assert "T" in first["created_at"]
+
+def test_export_endpoint(books, make_client):
+    client = make_client(admin.router)
+
+    res = client.get("/admin/export/books?format=jsonl")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    assert len(res.text.splitlines()) == 25
+
+    assert client.get("/admin/export/books").headers["content-type"].startswith("text/csv")
+    assert client.get("/admin/export/reminder_logs").status_code == 404
+    assert client.get("/admin/export/books?format=xml").status_code == 422
+
+def test_backup_copies_database(books, tmp_path):
+    dest = tmp_path / "copy.db"
+    backup.backup_database(str(dest))
+
+    copy = sqlite3.connect(dest)
+    assert copy.execute("SELECT COUNT(*) FROM books").fetchone() == (25,)
+    copy.close()
+    assert not os.path.exists(f"{dest}.partial")
+
+def test_failed_backup_removes_partial_file(engine, tmp_path, monkeypatch):
+    real_connect = sqlite3.connect
+
+    class FailingSource:
+        def backup(self, *args, **kwargs):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        def close(self):
+            pass
+
+    def fake_connect(path, *args, **kwargs):
+        if path == engine.url.database:
+            return FailingSource()
+        return real_connect(path, *args, **kwargs)
+
+    monkeypatch.setattr(backup.sqlite3, "connect", fake_connect)
+    dest = tmp_path / "copy.db"
+
+    with pytest.raises(sqlite3.OperationalError):
+        backup.backup_database(str(dest))
+    assert not os.path.exists(dest)
+    assert not os.path.exists(f"{dest}.partial")
+
+def test_scheduled_backup_prunes_old_copies(books, tmp_path):
+    backup_dir = tmp_path / "backups"
+    backup_dir.mkdir()
+    for stamp in ("20240101-000000", "20240102-000000", "20240103-000000"):
+        (backup_dir / f"library-{stamp}.db").write_bytes(b"")
+
+    path = backup.create_scheduled_backup(str(backup_dir), keep=2)
+
+    assert sorted(os.listdir(backup_dir)) == ["library-20240103-000000.db", os.path.basename(path)]
+
+def test_scheduled_backup_with_keep_zero_keeps_new_backup(books, tmp_path, monkeypatch):
+    backup_dir = tmp_path / "backups"
+    monkeypatch.setenv("BACKUP_DIR", str(backup_dir))
+    monkeypatch.setenv("BACKUP_KEEP", "0")
+
+    path = backup.create_scheduled_backup()
+
+    assert os.path.exists(path)
+    assert os.listdir(backup_dir) == [os.path.basename(path)]
@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import crud, database
+from app.routers import core
+from app.services import metadata
+
+DUNE = metadata.BookMetadata(isbn="9780441172719", title="Dune", author="Frank Herbert")
+
+class CountingProvider(metadata.LocalProvider):
+    """LocalProvider that counts calls and can be slowed down to overlap requests."""
+
+    def __init__(self, records=None, delay=0.0):
+        super().__init__(records)
+        self.delay = delay
+        self.calls = 0
+
+    def lookup(self, isbn):
+        self.calls += 1
+        time.sleep(self.delay)
+        return super().lookup(isbn)
+
+class FailingProvider(metadata.MetadataProvider):
+    def lookup(self, isbn):
+        raise RuntimeError("provider down")
+
+@pytest.fixture
+def provider():
+    return CountingProvider({DUNE.isbn: DUNE})
+
+def test_provider_interface_is_abstract():
+    with pytest.raises(TypeError):
+        metadata.MetadataProvider()
+
+def test_cache_hit_skips_provider(db, provider):
+    lookup = metadata.MetadataLookup(provider)
+
+    assert lookup.lookup(db, "978-0-441-17271-9") == DUNE
+    assert lookup.lookup(db, DUNE.isbn) == DUNE
+    assert provider.calls == 1
+    assert lookup.get_cached(db, DUNE.isbn).source == "local"
+
+def test_cached_miss(db, provider):
+    lookup = metadata.MetadataLookup(provider)
+
+    assert lookup.lookup(db, "0000000000") is None
+    assert lookup.lookup(db, "0000000000") is None
+    assert provider.calls == 1
+
+def test_expired_entries_are_refetched(db, provider):
+    lookup = metadata.MetadataLookup(provider, ttl=timedelta(days=30))
+    lookup.lookup(db, DUNE.isbn)
+    entry = crud.get_isbn_metadata(db, DUNE.isbn)
+    entry.fetched_at = datetime.now() - timedelta(days=31)
+    db.commit()
+
+    assert lookup.lookup(db, DUNE.isbn) == DUNE
+    assert provider.calls == 2
+
+def test_provider_errors_are_not_cached(db):
+    lookup = metadata.MetadataLookup(FailingProvider())
+
+    with pytest.raises(RuntimeError):
+        lookup.lookup(db, DUNE.isbn)
+    assert crud.get_isbn_metadata(db, DUNE.isbn) is None
+
+def test_concurrent_lookups_share_one_provider_call(engine):
+    provider = CountingProvider({DUNE.isbn: DUNE}, delay=0.2)
+    lookup = metadata.MetadataLookup(provider)
+    results = []
+
+    def worker():
+        session = database.SessionLocal()
+        try:
+            results.append(lookup.lookup(session, DUNE.isbn))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [DUNE] * 5
+    assert provider.calls == 1
+
+def test_leader_rechecks_cache(db, provider):
+    class LateMissLookup(metadata.MetadataLookup):
+        """Misses on the first cache read, as if another leader finished just after it."""
+        first_read = True
+
+        def get_cached(self, db, isbn):
+            if self.first_read:
+                self.first_read = False
+                return None
+            return super().get_cached(db, isbn)
+
+    metadata.MetadataLookup(provider).lookup(db, DUNE.isbn)
+    assert LateMissLookup(provider).lookup(db, DUNE.isbn) == DUNE
+    assert provider.calls == 1
+
+def test_prewarm_from_jsonl_and_csv(db, tmp_path):
+    jsonl = tmp_path / "dump.jsonl"
+    jsonl.write_text("\n".join(json.dumps(r) for r in [
+        {"isbn": "978-0-441-17271-9", "title": "Dune", "author": "Frank Herbert"},
+        {"isbn": "9780000000001", "title": ""},
+    ]) + "\n")
+    dump_csv = tmp_path / "dump.csv"
+    dump_csv.write_text("isbn,title,author\n9780000000002,Foundation,Isaac Asimov\n")
+
+    assert metadata.prewarm_cache(db, str(jsonl)) == 1
+    assert metadata.prewarm_cache(db, str(dump_csv)) == 1
+
+    provider = CountingProvider()
+    lookup = metadata.MetadataLookup(provider)
+    assert lookup.lookup(db, DUNE.isbn) == DUNE
+    assert lookup.lookup(db, "9780000000002").title == "Foundation"
+    assert provider.calls == 0
+
+def test_prewarmed_entries_do_not_expire(db, tmp_path):
+    dump_csv = tmp_path / "dump.csv"
+    dump_csv.write_text("isbn,title,author\n9780000000002,Foundation,Isaac Asimov\n")
+    metadata.prewarm_cache(db, str(dump_csv))
+    entry = crud.get_isbn_metadata(db, "9780000000002")
+    entry.fetched_at = datetime.now() - timedelta(days=3650)
+    db.commit()
+
+    provider = CountingProvider()
+    assert metadata.MetadataLookup(provider).lookup(db, "9780000000002").title == "Foundation"
+    assert provider.calls == 0
+
+def test_isbn_api_with_local_provider(make_client, provider):
+    lookup = metadata.MetadataLookup(provider)
+    client = make_client(core.router, overrides={metadata.get_lookup: lambda: lookup})
+
+    res = client.get(f"/api/isbn/{DUNE.isbn}")
+    assert res.status_code == 200
+    assert res.json() == {"isbn": DUNE.isbn, "title": "Dune", "author": "Frank Herbert"}
+    assert client.get("/api/isbn/0000000000").status_code == 404
+
+    failing = metadata.MetadataLookup(FailingProvider())
+    client = make_client(core.router, overrides={metadata.get_lookup: lambda: failing})
+    assert client.get("/api/isbn/1111111111").status_code == 502
+
+def test_add_book_form_prefilled_from_cache(db, tmp_path, make_client):
+    dump_csv = tmp_path / "dump.csv"
+    dump_csv.write_text('isbn,title,author\n9780441172719,Dune,"Herbert & <Sons>"\n')
+    metadata.prewarm_cache(db, str(dump_csv))
+    provider = CountingProvider()
+    lookup = metadata.MetadataLookup(provider)
+    client = make_client(core.router, overrides={metadata.get_lookup: lambda: lookup})
+
+    page = client.get("/book/9780441172719/add").text
+
+    assert 'value="Dune"' in page
+    assert 'value="Herbert &amp; &lt;Sons&gt;"' in page
+    assert "Book info found" in page
+    assert "/api/isbn/" not in page
+    assert provider.calls == 0
+
+def test_add_book_form_cached_miss_skips_lookup(db, provider, make_client):
+    lookup = metadata.MetadataLookup(provider)
+    lookup.lookup(db, "0000000000")
+    client = make_client(core.router, overrides={metadata.get_lookup: lambda: lookup})
+
+    page = client.get("/book/0000000000/add").text
+
+    assert "Book not found in database" in page
+    assert "/api/isbn/" not in page
+
+def test_add_book_form_uncached_falls_back_to_api(provider, make_client):
+    lookup = metadata.MetadataLookup(provider)
+    client = make_client(core.router, overrides={metadata.get_lookup: lambda: lookup})
+
+    page = client.get(f"/book/{DUNE.isbn}/add").text
+
+    assert "Looking up book info..." in page
+    assert "<script>" in page
+    assert "fetch(`/api/isbn/" in page
+    assert 'value=""' in page
+    assert provider.calls == 0
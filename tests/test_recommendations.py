@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from app import crud, models
+
+def _books(db, *isbns):
+    for isbn in isbns:
+        crud.create_book(db, isbn=isbn, title=f"Book {isbn}", author="Author")
+
+def _patron(db, name, *isbns):
+    patron = crud.create_patron(db, name=name, email=f"{name}@example.com")
+    for isbn in isbns:
+        crud.create_checkout(db, book_isbn=isbn, patron_id=patron.id)
+    return patron
+
+def test_neighbors_ranked_by_co_borrowers(db):
+    _books(db, "a", "b", "c", "d")
+    _patron(db, "p1", "a", "b", "c")
+    _patron(db, "p2", "a", "b")
+    _patron(db, "p3", "d")
+
+    crud.rebuild_book_neighbors(db)
+
+    assert [b.isbn for b in crud.get_book_neighbors(db, "a")] == ["b", "c"]
+    assert [b.isbn for b in crud.get_book_neighbors(db, "c")] == ["a", "b"]
+    assert crud.get_book_neighbors(db, "d") == []
+
+def test_high_ratings_count_towards_score(db):
+    _books(db, "a", "b", "c")
+    patron = _patron(db, "p1", "a", "b", "c")
+    crud.create_rating(db, book_isbn="a", patron_name="p1", star_rating=5, patron_id=patron.id)
+    crud.create_rating(db, book_isbn="c", patron_name="p1", star_rating=4, patron_id=patron.id)
+    crud.create_rating(db, book_isbn="b", patron_name="p1", star_rating=2, patron_id=patron.id)
+
+    crud.rebuild_book_neighbors(db)
+
+    top = db.query(models.BookNeighbor).filter_by(book_isbn="a", position=1).one()
+    assert (top.neighbor_isbn, top.co_borrowers, top.co_raters, top.score) == ("c", 1, 1, 2)
+
+def test_rebuild_replaces_previous_rows_and_skips_deleted_books(db):
+    _books(db, "a", "b", "c")
+    _patron(db, "p1", "a", "b", "c")
+    crud.rebuild_book_neighbors(db)
+    crud.delete_book(db, "c")
+
+    crud.rebuild_book_neighbors(db)
+
+    assert [b.isbn for b in crud.get_book_neighbors(db, "a")] == ["b"]
+    assert db.query(models.BookNeighbor).count() == 2
+
+def test_top_k_and_history_cap(db):
+    _books(db, "a", "b", "c", "d")
+    _patron(db, "p1", "a", "b", "c", "d")
+    # Make "d" the oldest loan so the history cap drops it first
+    oldest = db.query(models.Checkout).filter_by(book_isbn="d").one()
+    oldest.checked_out_at = datetime.now() - timedelta(days=365)
+    db.commit()
+
+    assert crud.rebuild_book_neighbors(db, top_k=1) == 4
+    assert crud.rebuild_book_neighbors(db, max_books=3) == 6
+    assert crud.get_book_neighbors(db, "d") == []
@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import crud, database, models, monitor
+from app.routers import admin
+
+LOAN_DAYS = crud.LOAN_PERIOD_DAYS
+
+def _seed(db):
+    """Two books and two patrons; one book borrowed twice, one returned late."""
+    for isbn in ("111", "222"):
+        crud.create_book(db, isbn=isbn, title=f"Book {isbn}", author="Author")
+    alice = crud.create_patron(db, name="Alice", email="alice@example.com")
+    bob = crud.create_patron(db, name="Bob", email="bob@example.com")
+
+    late = crud.create_checkout(db, book_isbn="111", patron_id=alice.id)
+    late.checked_out_at = datetime.now() - timedelta(days=30)
+    db.commit()
+    crud.return_checkout(db, late.id)
+
+    crud.create_checkout(db, book_isbn="111", patron_id=bob.id)
+    crud.create_checkout(db, book_isbn="222", patron_id=alice.id)
+
+def _snapshot(client):
+    return {
+        "summary": client.get("/admin/api/stats").json(),
+        "monthly": client.get("/admin/api/stats/monthly").json(),
+        "daily": client.get("/admin/api/stats/daily").json(),
+        "top": client.get("/admin/api/stats/top-books").json(),
+    }
+
+def test_incremental_rollups(db, make_client):
+    _seed(db)
+    summary = make_client(admin.router).get("/admin/api/stats").json()
+
+    assert summary["checkouts"] == 3
+    assert summary["returns"] == 1
+    assert summary["active_borrowers"] == 2
+    assert summary["average_loan_days"] == 30.0
+    assert summary["late_return_rate"] == 1.0
+
+def test_force_return_of_returned_checkout_is_not_counted_twice(db, make_client):
+    _seed(db)
+    returned = crud.get_checkout_history(db)[-1]
+    crud.return_checkout(db, returned.id)
+
+    assert make_client(admin.router).get("/admin/api/stats").json()["returns"] == 1
+
+def test_rebuild_matches_incremental(db, make_client):
+    for isbn in ("111", "222"):
+        crud.create_book(db, isbn=isbn, title=f"Book {isbn}", author="Author")
+    patron = crud.create_patron(db, name="Alice", email="alice@example.com")
+    first = crud.create_checkout(db, book_isbn="111", patron_id=patron.id)
+    crud.return_checkout(db, first.id)
+    crud.create_checkout(db, book_isbn="111", patron_id=patron.id)
+    crud.create_checkout(db, book_isbn="222", patron_id=patron.id)
+
+    client = make_client(admin.router)
+    incremental = _snapshot(client)
+    monitor.rebuild_circulation_stats()
+
+    assert _snapshot(client) == incremental
+
+def test_rebuild_after_deleting_borrowed_book(db, make_client):
+    _seed(db)
+    crud.return_checkout(db, crud.get_active_checkout_by_book(db, "222").id)
+    crud.delete_book(db, "222")
+
+    client = make_client(admin.router)
+    incremental = _snapshot(client)
+    assert [b["isbn"] for b in incremental["top"]] == ["111"]
+
+    db.close()
+    assert crud.rebuild_circulation_rollups(db) == 3
+    assert _snapshot(client)["top"] == incremental["top"]
+    assert _snapshot(client)["summary"]["checkouts"] == 3
+
+def test_overdue_rate_includes_active_overdue_loans(db, make_client):
+    _seed(db)
+    active = crud.get_active_checkout_by_book(db, "222")
+    active.checked_out_at = datetime.now() - timedelta(days=40)
+    db.commit()
+
+    monitor.check_overdue_books()
+    client = make_client(admin.router)
+    summary = client.get("/admin/api/stats").json()
+
+    assert summary["overdue_loans"] == 1
+    assert summary["late_return_rate"] == 1.0
+    assert summary["overdue_rate"] == 1.0
+
+    # The snapshot survives a rebuild
+    monitor.rebuild_circulation_stats()
+    assert client.get("/admin/api/stats").json()["overdue_loans"] == 1
+
+def test_overdue_loan_returned_before_next_check(db, make_client):
+    crud.create_book(db, isbn="111", title="Book 111", author="Author")
+    crud.create_book(db, isbn="222", title="Book 222", author="Author")
+    patron = crud.create_patron(db, name="Alice", email="alice@example.com")
+    on_time = crud.create_checkout(db, book_isbn="111", patron_id=patron.id)
+    crud.return_checkout(db, on_time.id)
+    overdue = crud.create_checkout(db, book_isbn="222", patron_id=patron.id)
+    overdue.checked_out_at = datetime.now() - timedelta(days=30)
+    db.commit()
+
+    monitor.check_overdue_books()
+    client = make_client(admin.router)
+    assert client.get("/admin/api/stats").json()["overdue_rate"] == 0.5
+
+    crud.return_checkout(db, overdue.id)
+    summary = client.get("/admin/api/stats").json()
+    assert summary["overdue_loans"] == 0
+    assert summary["late_return_rate"] == 0.5
+    assert summary["overdue_rate"] == 0.5
+
+def test_late_return_not_in_snapshot_keeps_snapshot(db, make_client):
+    crud.create_book(db, isbn="111", title="Book 111", author="Author")
+    patron = crud.create_patron(db, name="Alice", email="alice@example.com")
+    crud.set_overdue_loans(db, 1, datetime.now() - timedelta(days=2))
+    # Became overdue after the last check, so it was never part of the snapshot
+    loan = crud.create_checkout(db, book_isbn="111", patron_id=patron.id)
+    loan.checked_out_at = datetime.now() - timedelta(days=LOAN_DAYS + 1)
+    db.commit()
+
+    crud.return_checkout(db, loan.id)
+
+    assert make_client(admin.router).get("/admin/api/stats").json()["overdue_loans"] == 1
+
+def test_startup_backfill_runs_until_a_rebuild_completes(db, make_client):
+    crud.create_book(db, isbn="111", title="Book 111", author="Author")
+    patron = crud.create_patron(db, name="Alice", email="alice@example.com")
+    # History from before the rollups existed
+    db.add_all([models.Checkout(book_isbn="111", patron_id=patron.id, checked_out_at=datetime(2024, 1, 1)) for _ in range(3)])
+    db.commit()
+    # The all-time row now exists, but the history has not been backfilled
+    crud.create_checkout(db, book_isbn="111", patron_id=patron.id)
+    crud.set_overdue_loans(db, 0, datetime.now())
+
+    client = make_client(admin.router)
+    monitor.rebuild_circulation_stats(only_if_missing=True)
+    assert client.get("/admin/api/stats").json()["checkouts"] == 4
+    assert crud.get_last_rollup_build(db).high_water_checkout_id == 4
+
+    db.add(models.Checkout(book_isbn="111", patron_id=patron.id, checked_out_at=datetime(2024, 1, 2)))
+    db.commit()
+    monitor.rebuild_circulation_stats(only_if_missing=True)
+    assert client.get("/admin/api/stats").json()["checkouts"] == 4
+
+def test_rebuild_keeps_writes_made_during_build(engine, db, make_client):
+    _seed(db)
+    active_id = crud.get_active_checkout_by_book(db, "222").id
+    fired = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def write_during_build(conn, cursor, statement, parameters, context, executemany):
+        if "CREATE TEMP TABLE temp_rollup_borrowers" in statement and not fired:
+            fired.append(True)
+            other = database.SessionLocal()
+            try:
+                # Both commit while the build's read snapshot is open
+                crud.return_checkout(other, active_id)
+                crud.create_checkout(other, book_isbn="222", patron_id=crud.get_patron_by_name(other, "Bob").id)
+            finally:
+                other.close()
+
+    client = make_client(admin.router)
+    try:
+        assert crud.rebuild_circulation_rollups(db) == 4
+    finally:
+        event.remove(engine, "before_cursor_execute", write_during_build)
+    assert fired
+
+    during = _snapshot(client)
+    assert during["summary"]["checkouts"] == 4
+    assert during["summary"]["returns"] == 2
+
+    crud.rebuild_circulation_rollups(db)
+    assert _snapshot(client) == during